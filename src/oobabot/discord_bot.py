@@ -224,7 +224,7 @@ class DiscordBot(discord.Client):
 
         image_task = None
         if self.image_generator is not None and image_prompt is not None:
-            image_task = await self.image_generator.generate_image(
+            image_task = self.image_generator.generate_image(
                 image_prompt,
                 raw_message,
                 response_channel=response_channel,
@@ -376,11 +376,8 @@ class DiscordBot(discord.Client):
         sent_message_count = 0
         try:
             if self.stream_responses:
-                generator = self.ooba_client.request_as_grouped_tokens(
-                    prompt_prefix, interval=self.stream_responses_speed_limit
-                )
-                last_sent_message = await self._render_streaming_response(
-                    generator,
+                last_sent_message = await self._stream_response(
+                    prompt_prefix,
                     this_response_stat,
                     response_channel,
                     response_channel_id,
@@ -406,31 +403,17 @@ class DiscordBot(discord.Client):
                     if last_sent_message is not None:
                         sent_message_count = 1
                 else:
-                    sent_message_count = 0
-                    last_sent_message = None
-                    async for sentence in self.ooba_client.request_by_message(
-                        prompt_prefix
-                    ):
-                        (
-                            sent_message,
-                            abort_response,
-                        ) = await self._send_response_message(
-                            sentence,
-                            this_response_stat,
-                            response_channel,
-                            response_channel_id,
-                            allowed_mentions=allowed_mentions,
-                            reference=reference,
-                        )
-                        if sent_message is not None:
-                            last_sent_message = sent_message
-                            sent_message_count += 1
-                            # only use the reference for the first
-                            # message in a multi-message chain
-                            reference = None
-                        if abort_response:
-                            aborted_by_us = True
-                            break
+                    (
+                        sent_message_count,
+                        aborted_by_us,
+                    ) = await self._send_response_messages(
+                        prompt_prefix,
+                        this_response_stat,
+                        response_channel,
+                        response_channel_id,
+                        allowed_mentions,
+                        reference,
+                    )
 
         except discord.DiscordException as err:
             fancy_logger.get().error("Error: %s", err, exc_info=True)
@@ -455,6 +438,78 @@ class DiscordBot(discord.Client):
         this_response_stat.write_to_log(f"Response to {message.author_name} done!  ")
         self.response_stats.log_response_success(this_response_stat)
 
+    async def _stream_response(
+        self,
+        prompt_prefix: str,
+        this_response_stat: response_stats.ResponseStats,
+        response_channel: discord.abc.Messageable,
+        response_channel_id: int,
+        allowed_mentions: discord.AllowedMentions,
+        reference: typing.Optional[discord.MessageReference],
+    ) -> typing.Optional[discord.Message]:
+        """
+        Streams the response into a single message, editing it as
+        more of the response arrives.  Returns that message, or None
+        if nothing was sent.
+        """
+        generator = self.ooba_client.request_as_grouped_tokens(
+            prompt_prefix, interval=self.stream_responses_speed_limit
+        )
+        # close the generator even if we stop reading it early,
+        # so that the next request doesn't have to wait for it
+        # to be garbage-collected
+        try:
+            return await self._render_streaming_response(
+                generator,
+                this_response_stat,
+                response_channel,
+                response_channel_id,
+                allowed_mentions,
+                reference,
+            )
+        finally:
+            await generator.aclose()
+
+    async def _send_response_messages(
+        self,
+        prompt_prefix: str,
+        this_response_stat: response_stats.ResponseStats,
+        response_channel: discord.abc.Messageable,
+        response_channel_id: int,
+        allowed_mentions: discord.AllowedMentions,
+        reference: typing.Optional[discord.MessageReference],
+    ) -> typing.Tuple[int, bool]:
+        """
+        Sends each message the response is split into as it arrives.
+        Returns the number of messages sent, and whether we aborted
+        the response.
+        """
+        sent_message_count = 0
+        aborted_by_us = False
+        sentences = self.ooba_client.request_by_message(prompt_prefix)
+        # as above, close the generator even if we stop early
+        try:
+            async for sentence in sentences:
+                (sent_message, abort_response) = await self._send_response_message(
+                    sentence,
+                    this_response_stat,
+                    response_channel,
+                    response_channel_id,
+                    allowed_mentions=allowed_mentions,
+                    reference=reference,
+                )
+                if sent_message is not None:
+                    sent_message_count += 1
+                    # only use the reference for the first
+                    # message in a multi-message chain
+                    reference = None
+                if abort_response:
+                    aborted_by_us = True
+                    break
+        finally:
+            await sentences.aclose()
+        return (sent_message_count, aborted_by_us)
+
     async def _send_response_message(
         self,
         response: str,
@@ -8,6 +8,7 @@ them to the handler.
 import asyncio
 import json
 import pathlib
+import re
 import signal
 import typing
 
@@ -23,6 +24,32 @@ class Discrivener:
 
     KILL_TIMEOUT: float = 2.0
 
+    # size of the write buffer for the transcript log file.  Lines
+    # are collected here and written out in batches, rather than
+    # making a write() call for every line we receive.
+    LOG_FILE_BUFFER_SIZE: int = 1 << 16
+
+    # maximum number of lines waiting to be written to the transcript
+    # log file.  If the disk can't keep up, further lines are dropped
+    # rather than holding up the stdout reader.
+    LOG_QUEUE_SIZE: int = 1024
+
+    # maximum number of parsed messages waiting for the handler.
+    # If the handler falls this far behind, we stop reading from
+    # the process until it catches up.
+    MESSAGE_QUEUE_SIZE: int = 256
+
+    # longest line we'll accept from the process.  Transcriptions
+    # of long utterances include every token, and can easily
+    # exceed asyncio's default limit of 64KB.
+    LINE_LENGTH_LIMIT: int = 1 << 22
+
+    # whisper.cpp prints a lot of nonsense noise to stderr on
+    # startup.  Lines matching this are dropped without decoding.
+    WHISPER_NOISE_REGEX = re.compile(
+        rb"whisper_(?:init_state|init_from_file_no_state|model_load): "
+    )
+
     # pylint: disable=R1732
     def __init__(
         self,
@@ -39,8 +66,10 @@ class Discrivener:
         self._process: typing.Optional["asyncio.subprocess.Process"] = None
         self._stderr_reading_task: typing.Optional[asyncio.Task] = None
         self._stdout_reading_task: typing.Optional[asyncio.Task] = None
+        self._dispatch_task: typing.Optional[asyncio.Task] = None
+        self._log_writing_task: typing.Optional[asyncio.Task] = None
         if log_file is not None:
-            self._log_file = open(log_file, "a", encoding="utf-8")
+            self._log_file = open(log_file, "ab", buffering=self.LOG_FILE_BUFFER_SIZE)
         else:
             self._log_file = None
 
@@ -96,108 +125,237 @@ class Discrivener:
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            limit=self.LINE_LENGTH_LIMIT,
         )
         fancy_logger.get().info(
             "Discrivener process started, PID: %d", self._process.pid
         )
 
-        self._stderr_reading_task = asyncio.create_task(self._read_stderr())
-        self._stdout_reading_task = asyncio.create_task(self._read_stdout())
+        # parsed messages are handed off to a separate task, so that
+        # a slow handler doesn't hold up reading from the process.
+        # None marks the end of the process's output.
+        message_queue: "asyncio.Queue[typing.Optional[types.DiscrivenerMessage]]" = (
+            asyncio.Queue(maxsize=self.MESSAGE_QUEUE_SIZE)
+        )
+        # lines read from stdout are also queued up for the transcript
+        # log file, if we have one
+        log_queue: typing.Optional["asyncio.Queue[bytes]"] = None
+        if self._log_file is not None:
+            log_queue = asyncio.Queue(maxsize=self.LOG_QUEUE_SIZE)
+            self._log_writing_task = asyncio.create_task(
+                self._write_log_file(log_queue)
+            )
+        # hand the readers the process's streams directly, rather
+        # than having them look at self._process, which _kill_process()
+        # clears while they may still be running
+        assert self._process.stdout is not None
+        assert self._process.stderr is not None
+        self._stderr_reading_task = asyncio.create_task(
+            self._read_stderr(self._process.stderr)
+        )
+        self._stdout_reading_task = asyncio.create_task(
+            self._read_stdout(self._process.stdout, message_queue, log_queue)
+        )
+        self._dispatch_task = asyncio.create_task(
+            self._dispatch_messages(message_queue)
+        )
 
     async def _kill_process(self):
         if self._process is None:
             return
-        self._process.send_signal(signal.SIGINT)
+        process = self._process
+        process.send_signal(signal.SIGINT)
         try:
-            await asyncio.wait_for(self._process.wait(), timeout=self.KILL_TIMEOUT)
+            await asyncio.wait_for(process.wait(), timeout=self.KILL_TIMEOUT)
             fancy_logger.get().info(
-                "Discrivener process (PID %d) stopped gracefully", self._process.pid
+                "Discrivener process (PID %d) stopped gracefully", process.pid
             )
 
         except asyncio.TimeoutError:
             fancy_logger.get().warning(
                 "Discrivener process (PID %d) did not exit after %d seconds, killing",
-                self._process.pid,
+                process.pid,
                 self.KILL_TIMEOUT,
             )
-            self._process.kill()
-            await asyncio.wait_for(self._process.wait(), timeout=self.KILL_TIMEOUT)
+            # SIGKILL can't be ignored, so no need for another timeout here
+            process.kill()
+            await process.wait()
             fancy_logger.get().warning(
-                "Discrivener process (PID %d) force-killed", self._process.pid
+                "Discrivener process (PID %d) force-killed", process.pid
             )
         finally:
             self._process = None
-            if self._stderr_reading_task is not None:
-                self._stderr_reading_task.cancel()
-            if self._stdout_reading_task is not None:
-                self._stdout_reading_task.cancel()
+            await self._stop_tasks()
 
-        # terminate stdout and stderr reading tasks
-        if self._stderr_reading_task is not None:
-            await asyncio.wait_for(self._stderr_reading_task, timeout=self.KILL_TIMEOUT)
-            self._stderr_reading_task = None
+    async def _stop_tasks(self):
+        """
+        Stops the tasks reading from and dispatching messages for
+        the process, once it has exited.
+        """
+        # once the process has exited, stdout reaches EOF, and the
+        # dispatcher stops after handling what's still queued.  Let
+        # them finish rather than cancelling them, so that the last
+        # messages, like a final disconnect, aren't dropped.
+        draining_tasks = [
+            task
+            for task in (self._stdout_reading_task, self._dispatch_task)
+            if task is not None
+        ]
+        # the stderr reader only logs, and the log writer writes out
+        # whatever is still queued when cancelled
+        other_tasks = [
+            task
+            for task in (self._stderr_reading_task, self._log_writing_task)
+            if task is not None
+        ]
+        self._stderr_reading_task = None
+        self._stdout_reading_task = None
+        self._dispatch_task = None
+        self._log_writing_task = None
 
-        if self._stdout_reading_task is not None:
-            await asyncio.wait_for(self._stdout_reading_task, timeout=self.KILL_TIMEOUT)
-            self._stdout_reading_task = None
+        try:
+            if draining_tasks:
+                _, still_running = await asyncio.wait(
+                    draining_tasks, timeout=self.KILL_TIMEOUT
+                )
+                for task in still_running:
+                    fancy_logger.get().warning(
+                        "Discrivener: task %s did not finish, cancelling",
+                        task.get_name(),
+                    )
+                    task.cancel()
+        finally:
+            for task in other_tasks:
+                task.cancel()
+
+        # wait for all the tasks to finish, all in one go
+        all_tasks = draining_tasks + other_tasks
+        results = await asyncio.gather(*all_tasks, return_exceptions=True)
+        for task, result in zip(all_tasks, results):
+            # CancelledError isn't an Exception, so this skips the
+            # tasks that simply stopped when we cancelled them
+            if isinstance(result, Exception):
+                fancy_logger.get().error(
+                    "Discrivener: task %s failed: %s",
+                    task.get_name(),
+                    result,
+                    exc_info=result,
+                )
+
+    def _write_log_lines(self, lines: typing.List[bytes]):
+        if self._log_file is None:
+            return
+        try:
+            self._log_file.writelines(lines)
+            self._log_file.flush()
+        except (IOError, OSError) as err:
+            fancy_logger.get().warning("transcript: failed to log to file: %s", err)
+
+    async def _write_log_file(self, log_queue: "asyncio.Queue[bytes]"):
+        """
+        Writes lines from the log queue to the transcript log file,
+        doing the disk I/O in a worker thread so that it doesn't
+        block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        # the batch currently being written by the worker thread.
+        # Cancelling us doesn't stop that thread, so we shield it
+        # and let it finish before writing anything newer.
+        in_flight: typing.Optional["asyncio.Future[None]"] = None
+        try:
+            while True:
+                lines = [await log_queue.get()]
+                while not log_queue.empty():
+                    lines.append(log_queue.get_nowait())
+                in_flight = loop.run_in_executor(None, self._write_log_lines, lines)
+                await asyncio.shield(in_flight)
+                in_flight = None
+        finally:
+            if in_flight is not None:
+                await in_flight
+            # write out whatever was still waiting when we stopped
+            lines = []
+            while not log_queue.empty():
+                lines.append(log_queue.get_nowait())
+            self._write_log_lines(lines)
 
     # @fancy_logger.log_async_task
-    async def _read_stdout(self):
-        while True:
-            try:
-                if self._process is None or self._process.stdout is None:
-                    fancy_logger.get().debug(
-                        "Discrivener stdout reader: _process went away, exiting"
-                    )
+    async def _read_stdout(
+        self,
+        stdout: asyncio.StreamReader,
+        message_queue: "asyncio.Queue[typing.Optional[types.DiscrivenerMessage]]",
+        log_queue: typing.Optional["asyncio.Queue[bytes]"],
+    ):
+        try:
+            while True:
+                try:
+                    line_bytes = await stdout.readline()
+                except ValueError as err:
+                    # line was longer than LINE_LENGTH_LIMIT, and has
+                    # been discarded
+                    fancy_logger.get().error("Discrivener: %s", err)
+                    continue
+                if not line_bytes:
+                    # EOF
                     break
-                line_bytes = await self._process.stdout.readuntil()
-            except asyncio.IncompleteReadError:
-                break
-            line = line_bytes.decode("utf-8").strip()
-
-            if self._log_file is not None:
+                if log_queue is not None:
+                    try:
+                        log_queue.put_nowait(line_bytes)
+                    except asyncio.QueueFull:
+                        fancy_logger.get().warning(
+                            "transcript: log file is falling behind, dropping line"
+                        )
                 try:
-                    self._log_file.write(line + "\n")
-                except (IOError, OSError) as err:
-                    fancy_logger.get().warning(
-                        "transcript: failed to log to file: %s", err
+                    message = discrivener_message.from_json_line(line_bytes)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    fancy_logger.get().error(
+                        "Discrivener: could not parse %s",
+                        line_bytes.decode("utf-8", errors="replace").strip(),
                     )
+                    continue
+                await message_queue.put(message)
+            # let the dispatcher know there's nothing more coming
+            await message_queue.put(None)
+        finally:
+            # also runs when we're cancelled by _kill_process()
+            fancy_logger.get().info("Discrivener stdout reader exited")
+
+    async def _dispatch_messages(
+        self, message_queue: "asyncio.Queue[typing.Optional[types.DiscrivenerMessage]]"
+    ):
+        while True:
+            message = await message_queue.get()
+            if message is None:
+                # the process's output has ended
+                return
+            # keep going if the handler fails on one message, otherwise
+            # the queue fills up and we stop draining the process's stdout
             try:
-                message = json.loads(
-                    line,
-                    object_pairs_hook=discrivener_message.object_pairs_hook,
-                )
                 self._handler(message)
-            except json.JSONDecodeError:
-                fancy_logger.get().error("Discrivener: could not parse %s", line)
-
-        fancy_logger.get().info("Discrivener stdout reader exited")
+            except Exception:  # pylint: disable=broad-exception-caught
+                fancy_logger.get().error(
+                    "Discrivener: error handling message %s",
+                    message,
+                    exc_info=True,
+                )
 
     # @fancy_logger.log_async_task
-    async def _read_stderr(self):
-        print("reading stderr")
+    async def _read_stderr(self, stderr: asyncio.StreamReader):
         # loop until EOF, printing everything to stderr
-        while True:
-            try:
-                if self._process is None or self._process.stderr is None:
-                    fancy_logger.get().debug(
-                        "Discrivener stderr reader: _process went away, exiting"
-                    )
+        try:
+            while True:
+                try:
+                    line_bytes = await stderr.readuntil()
+                except asyncio.IncompleteReadError:
                     break
-                line_bytes = await self._process.stderr.readuntil()
-            except asyncio.IncompleteReadError:
-                break
-            line = line_bytes.decode("utf-8").strip()
-            if (
-                "whisper_init_state: " in line
-                or "whisper_init_from_file_no_state: " in line
-                or "whisper_model_load: " in line
-            ):
-                # workaround nonsense noise in whisper.cpp
-                continue
-            fancy_logger.get().error("Discrivener: %s", line)
-
-        fancy_logger.get().info("Discrivener stderr reader exited")
+                if self.WHISPER_NOISE_REGEX.search(line_bytes):
+                    # workaround nonsense noise in whisper.cpp
+                    continue
+                line = line_bytes.decode("utf-8", errors="replace").strip()
+                fancy_logger.get().error("Discrivener: %s", line)
+        finally:
+            # also runs when we're cancelled by _kill_process()
+            fancy_logger.get().info("Discrivener stderr reader exited")
 
     def speak(self, text: str):
         if self._process is None or self._process.stdin is None:
@@ -5,8 +5,10 @@ to deserialize them from JSON.
 """
 
 
-import collections
 import datetime
+import itertools
+import json
+import time
 import typing
 
 from oobabot import types
@@ -18,7 +20,57 @@ def object_pairs_hook(
     cls = MESSAGE_TYPE_TO_CLASS.get(pairs[0][0])
     if cls is not None and len(pairs) == 1:
         return cls(pairs[0][1])
-    return collections.OrderedDict(pairs)
+    return dict(pairs)
+
+
+def to_message(
+    data: typing.Any,
+) -> typing.Union["types.DiscrivenerMessage", typing.Any]:
+    """
+    Converts an already-decoded JSON message into the matching
+    Discrivener message class.
+
+    Unlike object_pairs_hook, this only looks at the top-level
+    object, so nested objects (like the tokens in a transcription)
+    are left as plain dicts rather than making a Python call
+    for every one of them during parsing.
+
+    Returns the data unchanged if it isn't a known message.
+    """
+    if isinstance(data, dict) and len(data) == 1:
+        ((key, value),) = data.items()
+        cls = MESSAGE_TYPE_TO_CLASS.get(key)
+        if cls is not None:
+            return cls(value)
+    return data
+
+
+# ChannelSilent is by far the most common message, and only
+# comes in these two shapes, so we skip the JSON parser for it
+CHANNEL_SILENT_LINES: typing.Dict[bytes, bool] = {
+    b'{"ChannelSilent":true}': True,
+    b'{"ChannelSilent":false}': False,
+}
+# room for a trailing "\r\n".  Anything longer can't be one of the
+# above, so we don't need to copy it to strip the line ending.
+CHANNEL_SILENT_MAX_LINE_LENGTH = max(len(line) for line in CHANNEL_SILENT_LINES) + 2
+
+
+def from_json_line(
+    line_bytes: bytes,
+) -> typing.Union["types.DiscrivenerMessage", typing.Any]:
+    """
+    Parses a single line of JSON output from Discrivener into
+    the matching Discrivener message class.
+
+    Raises json.JSONDecodeError or UnicodeDecodeError if the
+    line can't be parsed.
+    """
+    if len(line_bytes) <= CHANNEL_SILENT_MAX_LINE_LENGTH:
+        silent = CHANNEL_SILENT_LINES.get(line_bytes.rstrip())
+        if silent is not None:
+            return ChannelSilentData(silent)
+    return to_message(json.loads(line_bytes))
 
 
 class ChannelSilentData(types.DiscrivenerMessage):
@@ -26,7 +78,9 @@ class ChannelSilentData(types.DiscrivenerMessage):
     Represents whether any user is speaking in the channel.
     """
 
-    def __init__(self, data: dict):
+    __slots__ = ("silent",)
+
+    def __init__(self, data: bool):
         self.type = types.DiscrivenerMessageType.CHANNEL_SILENT
         self.silent = bool(data)
 
@@ -39,6 +93,8 @@ class ConnectData(types.DiscrivenerMessage):
     Represents us connecting or reconnecting to the voice channel.
     """
 
+    __slots__ = ("channel_id", "guild_id", "session_id", "server", "ssrc")
+
     def __init__(self, data: dict):
         self.type = types.DiscrivenerMessageType.CONNECT
         self.channel_id = data.get("channel_id")
@@ -62,6 +118,8 @@ class DisconnectData(types.DiscrivenerMessage):
     Represents a disconnect from the voice channel.
     """
 
+    __slots__ = ("kind", "reason", "channel_id", "guild_id", "session_id")
+
     def __init__(self, data: dict):
         self.type = types.DiscrivenerMessageType.DISCONNECT
         self.kind: str = data.get("kind", "unknown")
@@ -85,8 +143,9 @@ class UserJoinData(types.DiscrivenerMessage):
     Represents a user joining a voice channel.
     """
 
+    __slots__ = ("user_id",)
+
     def __init__(self, data: int):
-        print(f"UserJoinData data is {data}")
         self.type = types.DiscrivenerMessageType.USER_JOIN
         self.user_id: int = data
 
@@ -99,8 +158,9 @@ class UserLeaveData(types.DiscrivenerMessage):
     Represents a user leaving a voice channel.
     """
 
+    __slots__ = ("user_id",)
+
     def __init__(self, data: int):
-        print(f"UserLeaveData data is {data}")
         self.type = types.DiscrivenerMessageType.USER_LEAVE
         self.user_id: int = data
 
@@ -108,25 +168,6 @@ class UserLeaveData(types.DiscrivenerMessage):
         return f"User #{self.user_id} left voice channel"
 
 
-class TokenWithProbability:
-    """
-    Represents a token with a probability.
-    """
-
-    def __init__(self, data: dict):
-        self.probability: int = data.get("p", 0)
-        self.token_id: int = data.get("token_id", 0)
-        self.token_text: str = str(data.get("token_text"))
-
-    def __repr__(self):
-        return (
-            "TokenWithProbability("
-            + f"probability={self.probability}, "
-            + f"token_id={self.token_id}, "
-            + f"token_text={self.token_text})"
-        )
-
-
 def to_datetime(message: dict) -> datetime.datetime:
     """
     Converts a message into a datetime object.
@@ -148,25 +189,32 @@ def to_duration(message: dict) -> datetime.timedelta:
 class TextSegment:
     """
     Represents a single text segment of a transcribed message.
+
+    The text and probability of each token are kept in two
+    parallel lists, rather than as an object per token.
     """
 
+    __slots__ = ("token_texts", "probabilities", "start_offset_ms", "end_offset_ms")
+
     def __init__(self, message: dict):
-        self.tokens_with_probability = [
-            TokenWithProbability(data)
-            for data in message.get("tokens_with_probability", [])
+        tokens = message.get("tokens_with_probability", [])
+        self.token_texts: typing.List[str] = [
+            str(data.get("token_text")) for data in tokens
         ]
+        self.probabilities: typing.List[int] = [data.get("p", 0) for data in tokens]
         self.start_offset_ms: int = message.get("start_offset_ms", 0)
         self.end_offset_ms: int = message.get("end_offset_ms", self.start_offset_ms + 1)
 
     def __repr__(self):
         return (
-            f"TextSegment(tokens_with_probability={self.tokens_with_probability}, "
+            f"TextSegment(token_texts={self.token_texts}, "
+            + f"probabilities={self.probabilities}, "
             + f"start_offset_ms={self.start_offset_ms}, "
             + f"end_offset_ms={self.end_offset_ms})"
         )
 
     def __str__(self) -> str:
-        return "".join([t.token_text for t in self.tokens_with_probability])
+        return "".join(self.token_texts)
 
 
 class UserVoiceMessage(types.VoiceMessageWithTokens):
@@ -174,23 +222,35 @@ class UserVoiceMessage(types.VoiceMessageWithTokens):
     Represents a transcribed message.
     """
 
+    __slots__ = ("_processing_time", "_segments", "_latency")
+
+    # used in place of any missing durations in the message
+    DEFAULT_DURATION = {"nanos": 1_000_000}
+
     def __init__(self, message: dict):
+        now = time.time()
         self.type = types.DiscrivenerMessageType.TRANSCRIPTION
         self._processing_time: datetime.timedelta = to_duration(
-            message.get("processing_time", datetime.timedelta(milliseconds=1.0))
+            message.get("processing_time", self.DEFAULT_DURATION)
         )
         self._segments: typing.List[TextSegment] = [
             TextSegment(s) for s in message.get("segments", [])
         ]
+        start_timestamp = message.get("start_timestamp")
+        if start_timestamp:
+            start_time = to_datetime(start_timestamp)
+        else:
+            start_time = datetime.datetime.fromtimestamp(now)
+        audio_duration = to_duration(
+            message.get("audio_duration", self.DEFAULT_DURATION)
+        )
         super().__init__(
             message.get("user_id", 0),
-            to_datetime(message.get("start_timestamp", datetime.datetime.now)),
-            to_duration(
-                message.get("audio_duration", datetime.timedelta(milliseconds=1.0))
-            ),
+            start_time,
+            audio_duration,
         )
-        self._latency: datetime.timedelta = (
-            datetime.datetime.now() - self._start_time - self._audio_duration
+        self._latency: datetime.timedelta = datetime.timedelta(
+            seconds=now - start_time.timestamp() - audio_duration.total_seconds()
         )
 
     @property
@@ -212,7 +272,9 @@ class UserVoiceMessage(types.VoiceMessageWithTokens):
         """
         Returns the text of the transcription.
         """
-        return "".join([str(s) for s in self._segments])
+        return "".join(
+            itertools.chain.from_iterable(s.token_texts for s in self._segments)
+        )
 
     @property
     def is_bot(self) -> bool:
@@ -226,11 +288,12 @@ class UserVoiceMessage(types.VoiceMessageWithTokens):
         """
         Returns the tokens with their confidence.
         """
-        return [
-            (t.token_text, t.probability)
-            for s in self._segments
-            for t in s.tokens_with_probability
-        ]
+        return list(
+            zip(
+                itertools.chain.from_iterable(s.token_texts for s in self._segments),
+                itertools.chain.from_iterable(s.probabilities for s in self._segments),
+            )
+        )
 
     def __repr__(self) -> str:
         return (
@@ -244,12 +307,14 @@ class UserVoiceMessage(types.VoiceMessageWithTokens):
         )
 
 
+# keyed by the plain string values, rather than the enum members,
+# so that looking up a key from parsed JSON compares str to str
 MESSAGE_TYPE_TO_CLASS: typing.Dict[str, typing.Type[types.DiscrivenerMessage]] = {
-    types.DiscrivenerMessageType.CHANNEL_SILENT: ChannelSilentData,
-    types.DiscrivenerMessageType.CONNECT: ConnectData,
-    types.DiscrivenerMessageType.DISCONNECT: DisconnectData,
-    types.DiscrivenerMessageType.RECONNECT: ConnectData,
-    types.DiscrivenerMessageType.TRANSCRIPTION: UserVoiceMessage,
-    types.DiscrivenerMessageType.USER_JOIN: UserJoinData,
-    types.DiscrivenerMessageType.USER_LEAVE: UserLeaveData,
+    types.DiscrivenerMessageType.CHANNEL_SILENT.value: ChannelSilentData,
+    types.DiscrivenerMessageType.CONNECT.value: ConnectData,
+    types.DiscrivenerMessageType.DISCONNECT.value: DisconnectData,
+    types.DiscrivenerMessageType.RECONNECT.value: ConnectData,
+    types.DiscrivenerMessageType.TRANSCRIPTION.value: UserVoiceMessage,
+    types.DiscrivenerMessageType.USER_JOIN.value: UserJoinData,
+    types.DiscrivenerMessageType.USER_LEAVE.value: UserLeaveData,
 }
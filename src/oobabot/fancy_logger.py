@@ -3,13 +3,16 @@
 Logging with colors
 """
 
+import functools
 import html
 import logging
+import os
 import sys
 import textwrap
 import typing
 
 from oobabot import discord_utils
+from oobabot import ring_buffer
 
 FOREGROUND_COLORS = {
     "black": 30,
@@ -64,6 +67,22 @@ def apply_color_console(color: str, text: str, bg_color: str = "black") -> str:
     )
 
 
+def apply_no_color(_color: str, text: str, _bg_color: str = "black") -> str:
+    return text
+
+
+def should_use_color(stream: typing.TextIO) -> bool:
+    """
+    Returns whether we should add ANSI color codes to logs written
+    to the given stream.  We don't if it's redirected to a file or
+    a log collector, or if the user has set NO_COLOR.
+    """
+    if "NO_COLOR" in os.environ:
+        return False
+    isatty = getattr(stream, "isatty", None)
+    return isatty is not None and isatty()
+
+
 def apply_color_html(color: str, text: str) -> str:
     return f"<span class='oobabot-{color}'>{text}</span>"
 
@@ -93,25 +112,13 @@ class ColorfulLoggingFormatter(logging.Formatter):
     def __init__(
         self,
         coloring_book: typing.Dict[int, str],
-        fn_format_message: typing.Optional[
-            typing.Callable[[typing.Optional[typing.Any]], typing.Optional[typing.Any]]
-        ] = None,
     ) -> None:
         super().__init__()
         self.formatters = {}
         for logging_level, fmt_color in coloring_book.items():
             self.formatters[logging_level] = logging.Formatter(fmt_color)
-        self.fn_format_message = fn_format_message
 
     def format(self, record: logging.LogRecord) -> str:
-        if self.fn_format_message:
-            record = logging.makeLogRecord(record.__dict__)
-            record.msg = self.fn_format_message(record.msg)
-            # record.args is a tuple.  Call self.fn_format_message for each
-            # element of the tuple, and then reassemble the tuple.
-            if record.args:
-                record.args = tuple(self.fn_format_message(arg) for arg in record.args)
-
         formatter = self.formatters.get(record.levelno)
         if formatter:
             result = formatter.format(record)
@@ -128,6 +135,26 @@ class ColorfulLoggingFormatter(logging.Formatter):
         return record.getMessage()
 
 
+class HtmlLoggingFormatter(ColorfulLoggingFormatter):
+    """
+    Logging formatter that adds colors to the log levels,
+    and HTML-escapes the message and its arguments.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        # other handlers see the same record, so escape a copy
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = do_escape(record.msg)
+        # record.args is a tuple.  Call do_escape for each
+        # element of the tuple, and then reassemble the tuple.
+        if record.args:
+            record.args = tuple(do_escape(arg) for arg in record.args)
+        return super().format(record)
+
+
+# logging.getLogger() takes the logging module's lock on every call.
+# Loggers live for the life of the process, so just remember them.
+@functools.lru_cache(maxsize=None)
 def get(name: str = "oobabot") -> logging.Logger:
     return logging.getLogger(name)
 
@@ -150,10 +177,14 @@ def init_logging(
 
     if running_from_cli:
         console_handler = logging.StreamHandler()
+        fn_apply_color = apply_no_color
+        if should_use_color(console_handler.stream):
+            fn_apply_color = apply_color_console
+
         console_handler.setLevel(level)
         console_handler.setFormatter(
             ColorfulLoggingFormatter(
-                coloring_book=make_coloring_book(apply_color_console),
+                coloring_book=make_coloring_book(fn_apply_color),
             )
         )
         logger.addHandler(console_handler)
@@ -163,7 +194,7 @@ def init_logging(
             level=logging.INFO,
             formatter=ColorfulLoggingFormatter(
                 coloring_book=make_coloring_book(
-                    lambda a, b: apply_color_console(a, b, "magenta")
+                    lambda a, b: fn_apply_color(a, b, "magenta")
                 ),
             ),
             root=False,
@@ -171,107 +202,13 @@ def init_logging(
 
     recent_logs.setLevel(level)
     recent_logs.setFormatter(
-        ColorfulLoggingFormatter(
+        HtmlLoggingFormatter(
             coloring_book=make_coloring_book(apply_color_html),
-            fn_format_message=do_escape,
         )
     )
     logger.addHandler(recent_logs)
 
 
-# the following class was modified from O'Reilly's Python Cookbook,
-# chapter 5, section 19.  Its use is allowed under this license:
-# Copyright (c) 2001, Sébastien Keim
-# All rights reserved.
-# Redistribution and use in source and binary forms, with or without
-# modification, are permitted provided that the following conditions
-# are met:
-#    * Redistributions of source code must retain the above copyright
-#      notice, this list of conditions and the following disclaimer.
-#    * Redistributions in binary form must reproduce the above
-#      copyright notice, this list of conditions and the following
-#      disclaimer in the documentation and/or other materials provided
-#      with the distribution.
-#    * Neither the name of the <ORGANIZATION> nor the names of its
-#      contributors may be used to endorse or promote products derived
-#      from this software without specific prior written permission.
-# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
-# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
-# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
-# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE REGENTS
-# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
-# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
-# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
-# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
-# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
-# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
-# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
-class RingBuffer:
-    """
-    A generic ring buffer.
-    """
-
-    def __init__(self, size_max: int):
-        self.cur = 0
-        self.max = size_max
-        self.data: typing.List[str] = []
-
-    class _FullRingBuffer:
-        """
-        Class implementing the RingBuffer when it's full.
-        With python class magic, this class is swapped in when the
-        buffer becomes full.
-        """
-
-        cur: int
-        max: int
-        data: typing.List[str]
-
-        def append(self, val: str) -> None:
-            """
-            Append an element overwriting the oldest one.
-            """
-            self.data[self.cur] = val
-            self.cur = (self.cur + 1) % self.max
-
-        def get(self) -> typing.List[str]:
-            """
-            Return a list of elements from the oldest to the newest.
-            """
-            return self.data[self.cur :] + self.data[: self.cur]
-
-        def size(self) -> int:
-            """
-            Return the size of the buffer.
-            """
-            return self.max
-
-    def append(self, val: str) -> None:
-        """
-        Append an element at the end of the buffer.
-        """
-        self.data.append(val)
-        if len(self.data) == self.max:
-            self.cur = 0
-            # Permanently change self's class from non-full to full
-            self.__class__ = self._FullRingBuffer
-
-    def get(self) -> typing.List[str]:
-        """
-        Return a list of elements from the oldest to the newest.
-        """
-        return self.data
-
-    def size(self) -> int:
-        """
-        Return the number of elements currently in the buffer.
-        """
-        return len(self.data)
-
-
-# end of O'Reilly code
-
-
 class RingBufferedHandler(logging.Handler):
     """
     A singleton logging handler that stores the last N log messages in a ring buffer.
@@ -280,7 +217,7 @@ class RingBufferedHandler(logging.Handler):
     def __init__(self, buffer_size: int = 45) -> None:
         super().__init__()
         self.change_count = 0
-        self.buffer = RingBuffer(buffer_size)
+        self.buffer = ring_buffer.RingBuffer[str](buffer_size)
 
     def emit(self, record: logging.LogRecord) -> None:
         self.change_count += 1
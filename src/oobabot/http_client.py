@@ -34,6 +34,8 @@ class SerializedHttpClient(abc.ABC):
         sock_read=None,
     )
 
+    DNS_CACHE_TTL_SECONDS: int = 300
+
     @abc.abstractmethod
     async def _setup(self):
         # it's ok to raise an exception here, it will be caught
@@ -77,7 +79,13 @@ class SerializedHttpClient(abc.ABC):
         return self._session
 
     async def __aenter__(self):
-        connector = aiohttp.TCPConnector(limit_per_host=1)
+        # the servers we talk to rarely move, so cache their
+        # addresses for longer than aiohttp's 10-second default
+        # to skip a DNS lookup when reconnecting after a lull.
+        connector = aiohttp.TCPConnector(
+            limit_per_host=1,
+            ttl_dns_cache=self.DNS_CACHE_TTL_SECONDS,
+        )
         self._session = aiohttp.ClientSession(
             base_url=self.base_url,
             connector=connector,
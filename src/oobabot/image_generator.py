@@ -4,6 +4,8 @@ Generates images from Stable Diffusion
 """
 
 import asyncio
+import collections
+import functools
 import io
 import re
 import typing
@@ -20,12 +22,15 @@ from oobabot import templates
 
 async def image_task_to_file(image_task: "asyncio.Task[bytes]", image_request: str):
     await image_task
-    img_bytes = image_task.result()
-    file_of_bytes = io.BytesIO(img_bytes)
-    file = discord.File(file_of_bytes)
-    file.filename = "photo.png"
-    file.description = f"image generated from '{image_request}'"
-    return file
+    return image_bytes_to_file(image_task.result(), image_request)
+
+
+def image_bytes_to_file(img_bytes: bytes, image_request: str) -> discord.File:
+    return discord.File(
+        io.BytesIO(img_bytes),
+        filename="photo.png",
+        description=f"image generated from '{image_request}'",
+    )
 
 
 class StableDiffusionImageView(discord.ui.View):
@@ -46,6 +51,11 @@ class StableDiffusionImageView(discord.ui.View):
     LABEL_TRY_AGAIN = "Try Again"
     LABEL_DRAWING = "Drawing.."
 
+    # if a regenerated image is ready within this many seconds,
+    # we skip showing the "Drawing.." label, and update the
+    # message only once, to save a round-trip to Discord.
+    DRAWING_LABEL_DELAY_SECONDS = 0.5
+
     def __init__(
         self,
         stable_diffusion_client: sd_client.StableDiffusionClient,
@@ -54,11 +64,10 @@ class StableDiffusionImageView(discord.ui.View):
         requesting_user_id: int,
         requesting_user_name: str,
         template_store: templates.TemplateStore,
+        on_image_rejected: typing.Optional[typing.Callable[[], None]] = None,
     ):
         super().__init__(timeout=120.0)
 
-        self.template_store = template_store
-
         # only the user who requested generation of the image
         # can have it replaced
         self.requesting_user_id = requesting_user_id
@@ -66,95 +75,153 @@ class StableDiffusionImageView(discord.ui.View):
         self.image_prompt = image_prompt
         self.photo_accepted = False
 
-        #####################################################
-        # "Try Again" button
-        #
-        btn_try_again = discord.ui.Button(
-            label=self.LABEL_TRY_AGAIN,
-            style=discord.ButtonStyle.blurple,
-            row=1,
+        # the user name and prompt don't change for the life of
+        # the view, so neither do any of our messages
+        format_args = {
+            templates.TemplateToken.USER_NAME: requesting_user_name,
+            templates.TemplateToken.IMAGE_PROMPT: image_prompt,
+        }
+        self._image_message_text = template_store.format(
+            templates.Templates.IMAGE_CONFIRMATION, format_args
         )
-        self.image_message = None
-
-        async def on_try_again(interaction: discord.Interaction):
-            result = await self.diy_interaction_check(interaction)
-            if not result:
-                # unauthorized user
-                return
-
-            try:
-                btn_try_again.label = self.LABEL_DRAWING
-
-                # we disable all three buttons because otherwise
-                # the lock_in and delete buttons will flicker
-                # when we disable the try_again button.  And it
-                # doesn't make much sense for them to work anyway
-                # when the button is being regenerated.
-                btn_try_again.disabled = True
-                btn_lock_in.disabled = True
-                btn_delete.disabled = True
-
-                await interaction.response.defer()
-                await self.get_image_message().edit(view=self)
-
-                # generate a new image
-                regen_task = stable_diffusion_client.generate_image(
-                    image_prompt, is_channel_nsfw
-                )
-                regen_file = await image_task_to_file(regen_task, image_prompt)
-
-                btn_try_again.label = self.LABEL_TRY_AGAIN
-                btn_try_again.disabled = False
-                btn_lock_in.disabled = False
-                btn_delete.disabled = False
-
-                await self.get_image_message().edit(attachments=[regen_file], view=self)
-            except (http_client.OobaHttpClientError, discord.DiscordException) as err:
-                fancy_logger.get().error(
-                    "Could not regenerate image: %s", err, exc_info=True
-                )
-
-        btn_try_again.callback = on_try_again
-
-        #####################################################
-        # "Accept" button
-        #
-        btn_lock_in = discord.ui.Button(
-            label=self.LABEL_ACCEPT,
-            style=discord.ButtonStyle.success,
-            row=1,
+        self._detach_message = template_store.format(
+            templates.Templates.IMAGE_DETACH, format_args
+        )
+        self._unauthorized_message = template_store.format(
+            templates.Templates.IMAGE_UNAUTHORIZED, format_args
         )
 
-        async def on_lock_in(interaction: discord.Interaction):
-            result = await self.diy_interaction_check(interaction)
-            if not result:
-                # unauthorized user
-                return
-            await interaction.response.defer()
-            await self.detach_view_keep_img()
+        self.stable_diffusion_client = stable_diffusion_client
+        self.is_channel_nsfw = is_channel_nsfw
+        self.image_message = None
 
-        btn_lock_in.callback = on_lock_in
+        # called when the user deletes or replaces the image,
+        # or lets it time out
+        self.on_image_rejected = on_image_rejected
+
+        # set while we're regenerating the image, so that extra
+        # clicks don't each start another generation
+        self._pending_regen = False
+
+    #####################################################
+    # "Try Again" button
+    #
+    @discord.ui.button(
+        label=LABEL_TRY_AGAIN,
+        style=discord.ButtonStyle.blurple,
+        row=1,
+    )
+    async def try_again(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        result = await self.diy_interaction_check(interaction)
+        if not result:
+            # unauthorized user
+            return
 
-        #####################################################
-        # "Delete" button
-        #
-        btn_delete = discord.ui.Button(
-            label=self.LABEL_DELETE,
-            style=discord.ButtonStyle.danger,
-            row=1,
-        )
+        if self._pending_regen:
+            # we're already regenerating, ignore extra clicks
+            await interaction.response.defer()
+            return
 
-        async def on_delete(interaction: discord.Interaction):
-            result = await self.diy_interaction_check(interaction)
-            if not result:
-                # unauthorized user
-                return
+        self._pending_regen = True
+        # whether Discord is showing the "Drawing.." view, with
+        # all the buttons disabled
+        drawing_sent = False
+        regen_task: typing.Optional["asyncio.Task[bytes]"] = None
+        try:
+            self._set_drawing(button, True)
+            self._image_rejected()
             await interaction.response.defer()
-            await self.delete_image()
 
-        btn_delete.callback = on_delete
+            # generate a new image
+            regen_task = asyncio.create_task(
+                self.stable_diffusion_client.generate_image(
+                    self.image_prompt, self.is_channel_nsfw
+                )
+            )
+            done, _pending = await asyncio.wait(
+                {regen_task}, timeout=self.DRAWING_LABEL_DELAY_SECONDS
+            )
+            if not done:
+                await self.get_image_message().edit(view=self)
+                drawing_sent = True
 
-        super().add_item(btn_try_again).add_item(btn_lock_in).add_item(btn_delete)
+            regen_file = await image_task_to_file(regen_task, self.image_prompt)
+            self._set_drawing(button, False)
+            await self.get_image_message().edit(attachments=[regen_file], view=self)
+        except (http_client.OobaHttpClientError, discord.DiscordException) as err:
+            fancy_logger.get().error(
+                "Could not regenerate image: %s", err, exc_info=True
+            )
+            # let the user try again
+            self._set_drawing(button, False)
+            if drawing_sent:
+                try:
+                    await self.get_image_message().edit(view=self)
+                except discord.DiscordException as edit_err:
+                    fancy_logger.get().error(
+                        "Could not re-enable image buttons: %s",
+                        edit_err,
+                        exc_info=True,
+                    )
+        finally:
+            # if showing "Drawing.." failed, nobody is waiting for
+            # the new image anymore, so don't keep rendering it
+            if regen_task is not None and not regen_task.done():
+                regen_task.cancel()
+            self._pending_regen = False
+
+    def _set_drawing(self, btn_try_again: discord.ui.Button, drawing: bool):
+        if drawing:
+            btn_try_again.label = self.LABEL_DRAWING
+        else:
+            btn_try_again.label = self.LABEL_TRY_AGAIN
+
+        # we disable all three buttons because otherwise
+        # the lock_in and delete buttons will flicker
+        # when we disable the try_again button.  And it
+        # doesn't make much sense for them to work anyway
+        # when the button is being regenerated.
+        for item in self.children:
+            if isinstance(item, discord.ui.Button):
+                item.disabled = drawing
+
+    #####################################################
+    # "Accept" button
+    #
+    @discord.ui.button(
+        label=LABEL_ACCEPT,
+        style=discord.ButtonStyle.success,
+        row=1,
+    )
+    async def lock_in(
+        self, interaction: discord.Interaction, _button: discord.ui.Button
+    ):
+        result = await self.diy_interaction_check(interaction)
+        if not result:
+            # unauthorized user
+            return
+        await interaction.response.defer()
+        await self.detach_view_keep_img()
+
+    #####################################################
+    # "Delete" button
+    #
+    @discord.ui.button(
+        label=LABEL_DELETE,
+        style=discord.ButtonStyle.danger,
+        row=1,
+    )
+    async def delete(
+        self, interaction: discord.Interaction, _button: discord.ui.Button
+    ):
+        result = await self.diy_interaction_check(interaction)
+        if not result:
+            # unauthorized user
+            return
+        await interaction.response.defer()
+        await self.delete_image()
 
     def set_image_message(self, image_message: discord.Message):
         self.image_message = image_message
@@ -164,7 +231,12 @@ class StableDiffusionImageView(discord.ui.View):
             raise ValueError("image_message is None")
         return self.image_message
 
+    def _image_rejected(self):
+        if self.on_image_rejected is not None:
+            self.on_image_rejected()
+
     async def delete_image(self):
+        self._image_rejected()
         await self.detach_view_delete_img(self.get_detach_message())
 
     async def detach_view_delete_img(self, detach_msg: str):
@@ -191,27 +263,17 @@ class StableDiffusionImageView(discord.ui.View):
         """
         if interaction.user.id == self.requesting_user_id:
             return True
-        error_message = self._get_message(templates.Templates.IMAGE_UNAUTHORIZED)
         await interaction.response.send_message(
-            content=error_message,
+            content=self._unauthorized_message,
             ephemeral=True,
         )
         return False
 
     def get_image_message_text(self) -> str:
-        return self._get_message(templates.Templates.IMAGE_CONFIRMATION)
+        return self._image_message_text
 
     def get_detach_message(self) -> str:
-        return self._get_message(templates.Templates.IMAGE_DETACH)
-
-    def _get_message(self, message_type: templates.Templates) -> str:
-        return self.template_store.format(
-            message_type,
-            {
-                templates.TemplateToken.USER_NAME: self.requesting_user_name,
-                templates.TemplateToken.IMAGE_PROMPT: self.image_prompt,
-            },
-        )
+        return self._detach_message
 
 
 class ImageGenerator:
@@ -224,6 +286,16 @@ class ImageGenerator:
     # conclude that it is not an image prompt.
     MIN_IMAGE_PROMPT_LENGTH = 3
 
+    # number of recently generated images to keep, so that
+    # repeated requests for the same prompt can be answered
+    # without asking Stable Diffusion again.  Images are
+    # forgotten when the user deletes or replaces them.
+    IMAGE_CACHE_SIZE = 16
+
+    # image words containing any of these are treated as regexes,
+    # and can't be found with a plain substring search
+    REGEX_SPECIAL_CHARS = frozenset("\\.^$*+?{}[]|()")
+
     def __init__(
         self,
         ooba_client: ooba_client.OobaClient,
@@ -240,13 +312,69 @@ class ImageGenerator:
         self.stable_diffusion_client = stable_diffusion_client
         self.template_store = template_store
 
+        self.image_cache: typing.OrderedDict[
+            typing.Tuple[str, bool], bytes
+        ] = collections.OrderedDict()
+
         self.image_patterns = [
-            re.compile(
-                r"^.*\b" + image_word + r"\b[\s]*(of|with)?[\s]*[:]?(.*)$",
+            self._make_image_pattern(image_word, re.IGNORECASE)
+            for image_word in self.image_words
+        ]
+
+        # matches if any of the image words appear anywhere in the
+        # message, so most messages can be ruled out with a single
+        # search rather than one per image word.  Which word's
+        # pattern gets used is still decided in order, below.
+        self.any_image_word_pattern: typing.Optional["re.Pattern[str]"] = None
+        if self.image_words:
+            self.any_image_word_pattern = re.compile(
+                r"\b(?:"
+                + "|".join(f"(?:{image_word})" for image_word in self.image_words)
+                + r")\b",
                 re.IGNORECASE,
             )
+
+        # a substring search is much cheaper than a regex search, so
+        # if the image words are plain ASCII text, check for them that
+        # way first.  We stick to ASCII because that's where case-folding
+        # agrees exactly with IGNORECASE.  Elsewhere it doesn't: "ß"
+        # folds to "ss", which IGNORECASE won't match, and IGNORECASE
+        # matches "ı" to "i", which case-folding doesn't.
+        self.image_words_folded: typing.Optional[typing.Tuple[str, ...]] = None
+        if not any(
+            self.REGEX_SPECIAL_CHARS.intersection(image_word)
+            or not image_word.isascii()
             for image_word in self.image_words
-        ]
+        ):
+            self.image_words_folded = tuple(
+                image_word.casefold() for image_word in self.image_words
+            )
+
+        # when the image words are plain text, we can also search
+        # the already case-folded message with case-sensitive
+        # patterns, which is faster than using IGNORECASE
+        self.image_patterns_folded: typing.List["re.Pattern[str]"] = []
+        if self.image_words_folded is not None:
+            self.image_patterns_folded = [
+                self._make_image_pattern(image_word)
+                for image_word in self.image_words_folded
+            ]
+
+        # a message containing a plain-text image word and a long
+        # enough prompt can't be shorter than this, so shorter
+        # messages can be skipped without searching them at all
+        self.min_image_request_length = 0
+        if self.image_words_folded is not None and self.image_words:
+            self.min_image_request_length = (
+                min(len(image_word) for image_word in self.image_words)
+                + self.MIN_IMAGE_PROMPT_LENGTH
+            )
+
+    @staticmethod
+    def _make_image_pattern(image_word: str, flags: int = 0) -> "re.Pattern[str]":
+        return re.compile(
+            r"^.*\b" + image_word + r"\b[\s]*(of|with)?[\s]*[:]?(.*)$", flags
+        )
 
     def on_ready(self):
         """
@@ -270,22 +398,11 @@ class ImageGenerator:
         if isinstance(raw_message.channel, discord.TextChannel):
             is_channel_nsfw = raw_message.channel.is_nsfw()
 
-        image_task = self.stable_diffusion_client.generate_image(
-            image_prompt, is_channel_nsfw=is_channel_nsfw
-        )
-        try:
-            file = await image_task_to_file(image_task, image_prompt)
-        except (http_client.OobaHttpClientError, discord.DiscordException) as err:
-            fancy_logger.get().error("Could not generate image: %s", err, exc_info=True)
-            error_message = self.template_store.format(
-                templates.Templates.IMAGE_GENERATION_ERROR,
-                {
-                    templates.TemplateToken.USER_NAME: raw_message.author.display_name,
-                    templates.TemplateToken.IMAGE_PROMPT: image_prompt,
-                },
-            )
-            return await response_channel.send(error_message, reference=raw_message)
+        cache_key = (image_prompt, is_channel_nsfw)
 
+        # get everything but the image ready before we start waiting
+        # on Stable Diffusion, so that we can send the message as soon
+        # as the image arrives.
         regen_view = StableDiffusionImageView(
             self.stable_diffusion_client,
             is_channel_nsfw=is_channel_nsfw,
@@ -302,6 +419,37 @@ class ImageGenerator:
         if raw_message.channel == response_channel:
             kwargs["reference"] = raw_message
 
+        try:
+            img_bytes = self.image_cache.get(cache_key)
+            if img_bytes is None:
+                img_bytes = await self.stable_diffusion_client.generate_image(
+                    image_prompt, is_channel_nsfw=is_channel_nsfw
+                )
+                self.image_cache[cache_key] = img_bytes
+                if len(self.image_cache) > self.IMAGE_CACHE_SIZE:
+                    self.image_cache.popitem(last=False)
+            else:
+                fancy_logger.get().debug(
+                    "Stable Diffusion: reusing cached image for: %s", image_prompt
+                )
+                self.image_cache.move_to_end(cache_key)
+            # other users may be shown the same cached image, so
+            # only let this view evict the image it was shown
+            regen_view.on_image_rejected = functools.partial(
+                self._forget_image, cache_key, img_bytes
+            )
+            file = image_bytes_to_file(img_bytes, image_prompt)
+        except (http_client.OobaHttpClientError, discord.DiscordException) as err:
+            fancy_logger.get().error("Could not generate image: %s", err, exc_info=True)
+            error_message = self.template_store.format(
+                templates.Templates.IMAGE_GENERATION_ERROR,
+                {
+                    templates.TemplateToken.USER_NAME: raw_message.author.display_name,
+                    templates.TemplateToken.IMAGE_PROMPT: image_prompt,
+                },
+            )
+            return await response_channel.send(error_message, reference=raw_message)
+
         image_message = await response_channel.send(
             content=regen_view.get_image_message_text(),
             file=file,
@@ -311,20 +459,45 @@ class ImageGenerator:
         regen_view.image_message = image_message
         return image_message
 
+    def _forget_image(self, cache_key: typing.Tuple[str, bool], img_bytes: bytes):
+        # the image may have been rejected already and a new one
+        # cached in its place, which we should keep
+        if self.image_cache.get(cache_key) is img_bytes:
+            del self.image_cache[cache_key]
+
     def maybe_get_image_prompt(
         self, raw_message: discord.Message
     ) -> typing.Optional[str]:
-        for image_pattern in self.image_patterns:
-            match = image_pattern.search(raw_message.content)
+        if self.any_image_word_pattern is None:
+            return None
+        content = raw_message.content
+        if len(content) < self.min_image_request_length:
+            return None
+        search_content = content
+        image_patterns = self.image_patterns
+        if self.image_words_folded is not None and content.isascii():
+            # ASCII text folds one character to one character, exactly
+            # as IGNORECASE would, so the folded patterns find the same
+            # matches at the same positions.  We take the prompt from
+            # the original, to keep its case.
+            content_folded = content.casefold()
+            if not any(word in content_folded for word in self.image_words_folded):
+                return None
+            search_content = content_folded
+            image_patterns = self.image_patterns_folded
+        elif not self.any_image_word_pattern.search(content):
+            return None
+        for image_pattern in image_patterns:
+            match = image_pattern.search(search_content)
             if match:
-                image_prompt = match.group(2)
+                image_prompt = content[match.start(2) : match.end(2)]
                 if len(image_prompt) < self.MIN_IMAGE_PROMPT_LENGTH:
                     continue
                 fancy_logger.get().debug("Found image prompt: %s", image_prompt)
                 return image_prompt
         return None
 
-    async def generate_image(
+    def generate_image(
         self,
         user_image_keywords: str,
         raw_message: discord.Message,
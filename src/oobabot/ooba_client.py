@@ -4,8 +4,10 @@ Client for the Ooba API.
 Can provide the response by token or by sentence.
 """
 import abc
+import asyncio
 import json
 import re
+import sys
 import time
 import typing
 
@@ -22,12 +24,16 @@ class MessageSplitter(abc.ABC):
     Split a response into separate messages.
     """
 
-    # anything that can't be in a real response
+    # anything that can't be in a real response.  Since it's the
+    # empty string, and we never pass along empty tokens otherwise,
+    # the per-token checks just test the token's truthiness.
     END_OF_INPUT = ""
 
     def __init__(self):
-        self.printed_idx = 0
-        self.full_response = ""
+        # text we've received but not yet yielded.  We only keep
+        # this tail, rather than the whole response, so that the
+        # work per token doesn't grow with the length of the response.
+        self.pending = ""
 
     def next(self, new_token: str) -> typing.Generator[str, None, None]:
         """
@@ -48,23 +54,24 @@ class MessageSplitter(abc.ABC):
         doesn't look like a full sentence.
         """
 
-        self.full_response += new_token
-        unseen = self.full_response[self.printed_idx :]
+        self.pending += new_token
 
         # if we've reached the end of input, yield it all,
         # even if we don't think it's a full sentence.
-        if self.END_OF_INPUT == new_token:
-            to_print = unseen.strip()
-            if to_print:
+        if not new_token:
+            unseen, self.pending = self.pending, ""
+            if unseen.strip():
                 yield unseen
-            self.printed_idx += len(unseen)
             return
 
-        yield from self.partition(unseen)
+        yield from self.partition()
 
     @abc.abstractmethod
-    def partition(self, unseen: str) -> typing.Generator[str, None, None]:
-        pass
+    def partition(self) -> typing.Generator[str, None, None]:
+        """
+        Yields any complete messages at the start of self.pending,
+        removing them from it.
+        """
 
 
 class RegexSplitter(MessageSplitter):
@@ -72,19 +79,18 @@ class RegexSplitter(MessageSplitter):
     Split a response into separate messages using a regex.
     """
 
-    def __init__(self, regex: str):
+    def __init__(self, regex: typing.Union[str, "re.Pattern[str]"]):
         super().__init__()
+        # re.compile() hands back already-compiled patterns as-is
         self.pattern = re.compile(regex)
 
-    def partition(self, unseen: str) -> typing.Generator[str, None, None]:
+    def partition(self) -> typing.Generator[str, None, None]:
         while True:
-            match = self.pattern.match(unseen)
+            match = self.pattern.match(self.pending)
             if not match:
                 break
-            to_print = match.group(1)
-            yield to_print
-            self.printed_idx += match.end()
-            unseen = self.full_response[self.printed_idx :]
+            self.pending = self.pending[match.end() :]
+            yield match.group(1)
 
 
 class SentenceSplitter(MessageSplitter):
@@ -93,15 +99,42 @@ class SentenceSplitter(MessageSplitter):
     sentence word breaks.
     """
 
+    # the segmenter's rules don't change, so every splitter shares
+    # one.  segment() keeps the text it was last given on the
+    # segmenter, but it runs to completion without yielding to
+    # the event loop, so calls from different responses can't
+    # interleave.
+    SEGMENTER = pysbd.Segmenter(language="en", clean=False, char_span=True)
+
+    # pysbd only ever breaks sentences at punctuation, quotes, line
+    # breaks, or around parentheticals, so until one of these shows
+    # up in the pending text there's no point in running the
+    # (comparatively slow) segmenter.
+    SENTENCE_BREAK_PATTERN = re.compile(
+        r"[.!?;()\"'\u2018\u2019\u201c\u201d\r\n\u3002\uff01\uff0e\uff1f]"
+    )
+
     def __init__(self):
         super().__init__()
-        self.segmenter = pysbd.Segmenter(language="en", clean=False, char_span=True)
+        self.segmenter = self.SEGMENTER
+
+    def partition(self) -> typing.Generator[str, None, None]:
+        if not self.SENTENCE_BREAK_PATTERN.search(self.pending):
+            # the segmenter would also have dropped any leading
+            # whitespace, so keep doing that.
+            self.pending = self.pending.lstrip()
+            return
 
-    def partition(self, unseen: str) -> typing.Generator[str, None, None]:
         segments: typing.List[pysbd.utils.TextSpan] = self.segmenter.segment(
-            unseen
+            self.pending
         )  # type: ignore -- type is determined by char_span=True above
 
+        # since we're about to print all the previous segments,
+        # the start of the last segment becomes the starting
+        # point for the next round.
+        if len(segments) > 0:
+            self.pending = self.pending[segments[-1].start :]  # type: ignore
+
         # any remaining non-sentence things will be in the last element
         # of the list.  Don't print that yet.  At the very worst, we'll
         # print it when the END_OF_INPUT signal is reached.
@@ -120,12 +153,6 @@ class SentenceSplitter(MessageSplitter):
 
             yield to_print
 
-        # since we've printed all the previous segments,
-        # the start of the last segment becomes the starting
-        # point for the next round.
-        if len(segments) > 0:
-            self.printed_idx += segments[-1].start  # type: ignore
-
 
 class OobaClient(http_client.SerializedHttpClient):
     """
@@ -136,6 +163,10 @@ class OobaClient(http_client.SerializedHttpClient):
 
     OOBABOOGA_STREAMING_URI_PATH: str = "/api/v1/stream"
 
+    # some models start their replies with this, remove it
+    ASSISTANT_PREFIX = "### Assistant: "
+    ASSISTANT_PREFIX_LEN = len(ASSISTANT_PREFIX)
+
     def __init__(
         self,
         settings: typing.Dict[str, typing.Any],
@@ -146,8 +177,29 @@ class OobaClient(http_client.SerializedHttpClient):
         self.request_params = settings["request_params"]
         self.log_all_the_things = settings["log_all_the_things"]
 
+        # the request parameters are the same for every request, so
+        # encode them to JSON once.  Each request then only needs to
+        # encode its prompt and put it in front.
+        if self.request_params:
+            self._request_json_tail = ", " + json.dumps(self.request_params)[1:]
+        else:
+            self._request_json_tail = "}"
+
+        # the streaming API lets us send one request after another
+        # on the same websocket, so we keep it open between requests
+        # to save a handshake each time.  The lock makes sure only
+        # one request uses it at a time.  Both are created and torn
+        # down along with the HTTP session.
+        self._websocket: typing.Optional[aiohttp.ClientWebSocketResponse] = None
+        self._websocket_lock: typing.Optional[asyncio.Lock] = None
+        # reads from the websocket while it's waiting for the next
+        # request.  See _read_while_idle().
+        self._idle_reader: typing.Optional[asyncio.Task] = None
+
         if self.message_regex:
-            self.fn_new_splitter = lambda: RegexSplitter(self.message_regex)
+            # compile the regex once here, rather than for every response
+            message_pattern = re.compile(self.message_regex)
+            self.fn_new_splitter = lambda: RegexSplitter(message_pattern)
         else:
             self.fn_new_splitter = SentenceSplitter
 
@@ -168,8 +220,74 @@ class OobaClient(http_client.SerializedHttpClient):
             )
 
     async def _setup(self):
-        async with self._get_session().ws_connect(self.OOBABOOGA_STREAMING_URI_PATH):
-            return
+        websocket, _reused = await self._connect_websocket()
+        self._start_idle_reader(websocket)
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        self._websocket_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *err):
+        await self._close_websocket()
+        self._websocket_lock = None
+        await super().__aexit__(*err)
+
+    async def _connect_websocket(
+        self,
+    ) -> typing.Tuple[aiohttp.ClientWebSocketResponse, bool]:
+        """
+        Returns our websocket, connecting if needed, and whether
+        it was an existing connection that we reused.
+        """
+        await self._stop_idle_reader()
+        websocket = self._websocket
+        if websocket is not None:
+            if not websocket.closed and websocket.exception() is None:
+                return websocket, True
+            # it failed or was closed since the last request
+            await self._close_websocket()
+        # token frames are only a few dozen bytes, too small for
+        # compression to pay for the zlib work on both ends, so
+        # don't offer permessage-deflate.
+        self._websocket = await self._get_session().ws_connect(
+            self.OOBABOOGA_STREAMING_URI_PATH,
+            compress=0,
+        )
+        return self._websocket, False
+
+    async def _close_websocket(self):
+        await self._stop_idle_reader()
+        websocket, self._websocket = self._websocket, None
+        if websocket is not None:
+            await websocket.close()
+
+    def _start_idle_reader(self, websocket: aiohttp.ClientWebSocketResponse):
+        self._idle_reader = asyncio.create_task(self._read_while_idle(websocket))
+
+    async def _stop_idle_reader(self):
+        idle_reader, self._idle_reader = self._idle_reader, None
+        if idle_reader is not None:
+            idle_reader.cancel()
+            await asyncio.gather(idle_reader, return_exceptions=True)
+
+    async def _read_while_idle(self, websocket: aiohttp.ClientWebSocketResponse):
+        """
+        Reads from the websocket between requests.
+
+        aiohttp only answers the server's pings, and only notices the
+        server closing the connection, while something is reading from
+        it.  Without this, an idle websocket would be dropped by the
+        server, and still look open when the next request came along.
+        """
+        # pings are answered inside receive(), so it only returns
+        # once the connection is closing, or on a stray message
+        msg = await websocket.receive()
+        if not websocket.closed:
+            fancy_logger.get().debug(
+                "Ooba Client: closing idle websocket after %s", msg
+            )
+            await websocket.close()
 
     def get_stopping_strings(self) -> typing.List[str]:
         """
@@ -179,66 +297,128 @@ class OobaClient(http_client.SerializedHttpClient):
         """
         return self.request_params.get("stopping_strings", [])
 
-    async def request_by_message(self, prompt: str) -> typing.AsyncIterator[str]:
+    async def request_by_message(self, prompt: str) -> typing.AsyncGenerator[str, None]:
         """
         Yields individual messages from the response as it arrives.
         These can be split by a regex or by sentence.
+
+        If you stop iterating early, call aclose() on the result,
+        as described in request_by_token().
         """
         splitter = self.fn_new_splitter()
-        async for new_token in self.request_by_token(prompt):
-            for sentence in splitter.next(new_token):
-                # remove "### Assistant: " from strings
-                if sentence.startswith("### Assistant: "):
-                    sentence = sentence[len("### Assistant: ") :]
-                yield sentence
+        tokens = self.request_by_token(prompt)
+        try:
+            async for new_token in tokens:
+                for sentence in splitter.next(new_token):
+                    if sentence.startswith(self.ASSISTANT_PREFIX):
+                        sentence = sentence[self.ASSISTANT_PREFIX_LEN :]
+                    yield sentence
+        finally:
+            await tokens.aclose()
 
     async def request_as_string(self, prompt: str) -> str:
         """
-        Yields the entire response as a single string.
+        Returns the entire response as a single string.
         """
-        return "".join([token async for token in self.request_by_token(prompt)])
+        # run request_by_token all the way to the end, rather than
+        # stopping at END_OF_INPUT, so that it releases the websocket
+        # before we return.  END_OF_INPUT is empty, so it doesn't
+        # change the result.
+        tokens: typing.List[str] = []
+        async for token in self.request_by_token(prompt):
+            tokens.append(token)
+        return "".join(tokens)
 
     async def request_as_grouped_tokens(
         self,
         prompt: str,
         interval: float = 0.2,
-    ) -> typing.AsyncIterator[str]:
+    ) -> typing.AsyncGenerator[str, None]:
         """
         Yields the response as a series of tokens, grouped by time.
+
+        If you stop iterating early, call aclose() on the result,
+        as described in request_by_token().
         """
 
         last_response = time.perf_counter()
         tokens = ""
-        async for token in self.request_by_token(prompt):
-            if token == SentenceSplitter.END_OF_INPUT:
-                if tokens:
-                    yield tokens
-                break
-            tokens += token
-            now = time.perf_counter()
-            if now < (last_response + interval):
-                continue
-            yield tokens
-            tokens = ""
-            last_response = time.perf_counter()
-
-    async def request_by_token(self, prompt: str) -> typing.AsyncIterator[str]:
+        response_tokens = self.request_by_token(prompt)
+        try:
+            async for token in response_tokens:
+                if not token:
+                    if tokens:
+                        yield tokens
+                    break
+                tokens += token
+                now = time.perf_counter()
+                if now < (last_response + interval):
+                    continue
+                yield tokens
+                tokens = ""
+                last_response = time.perf_counter()
+        finally:
+            await response_tokens.aclose()
+
+    async def request_by_token(self, prompt: str) -> typing.AsyncGenerator[str, None]:
         """
         Yields each token of the response as it arrives.
+
+        This holds the client's websocket, and with it every other
+        request, until the response is finished.  If you stop iterating
+        before then, call aclose() on the result, so that the websocket
+        is released right away, rather than whenever the abandoned
+        generator gets garbage-collected.
+        """
+        if self._websocket_lock is None:
+            raise http_client.OobaHttpClientError("Session not initialized")
+        async with self._websocket_lock:
+            finished = False
+            response_tokens = self._request_by_token(prompt)
+            try:
+                async for token in response_tokens:
+                    if not token:
+                        finished = True
+                    yield token
+            finally:
+                await response_tokens.aclose()
+                # if we didn't read the response all the way to the end,
+                # the rest of it would be waiting for the next request.
+                # So start over with a new connection.
+                if not finished:
+                    await self._close_websocket()
+                elif self._websocket is not None:
+                    self._start_idle_reader(self._websocket)
+
+    def _request_json(self, prompt: str) -> str:
         """
+        Returns the JSON-encoded request for the given prompt,
+        equivalent to {"prompt": prompt, **self.request_params}.
+        """
+        return '{"prompt": ' + json.dumps(prompt) + self._request_json_tail
+
+    async def _send_request(self, request_json: str) -> aiohttp.ClientWebSocketResponse:
+        """
+        Sends the request on our websocket, connecting if needed.
+        Returns the websocket the request was sent on.
+        """
+        # the server closes connections that have been idle for
+        # a while.  If sending on the connection we reused fails,
+        # reconnect and send the request again.  Once it's sent,
+        # we don't retry, since the server may already be working
+        # on it.
+        while True:
+            websocket, reused = await self._connect_websocket()
+            try:
+                await websocket.send_str(request_json)
+            except (ConnectionResetError, aiohttp.ClientError):
+                await self._close_websocket()
+                if reused:
+                    continue
+                raise
 
-        request: dict[
-            str, typing.Union[bool, float, int, str, typing.List[typing.Any]]
-        ] = {
-            "prompt": prompt,
-        }
-        request.update(self.request_params)
-
-        async with self._get_session().ws_connect(
-            self.OOBABOOGA_STREAMING_URI_PATH
-        ) as websocket:
-            await websocket.send_json(request)
             if self.log_all_the_things:
+                request = json.loads(request_json)
                 try:
                     print(f"Sent request:\n{json.dumps(request, indent=1)}")
                     print(f"Prompt:\n{str(request['prompt'])}")
@@ -249,54 +429,57 @@ class OobaClient(http_client.SerializedHttpClient):
                     )
                     print(f"Prompt:\n{str(request['prompt']).encode('utf-8')}")
 
-            async for msg in websocket:
-                # we expect a series of text messages in JSON encoding,
-                # like this:
-                #
-                # {"event": "text_stream", "message_num": 0, "text": ""}
-                # {"event": "text_stream", "message_num": 1, "text": "Oh"}
-                # {"event": "text_stream", "message_num": 2, "text": ","}
-                # {"event": "text_stream", "message_num": 3, "text": " okay"}
-                # {"event": "text_stream", "message_num": 4, "text": "."}
-                # {"event": "stream_end", "message_num": 5}
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    # bdata = typing.cast(bytes, msg.data)
-                    # get_logger().debug(f"Received data: {bdata}")
-
-                    incoming_data = msg.json()
-                    if "text_stream" == incoming_data["event"]:
-                        self.total_response_tokens += 1
-                        text = incoming_data["text"]
-                        if text != SentenceSplitter.END_OF_INPUT:
-                            if self.log_all_the_things:
-                                try:
-                                    print(text, end="", flush=True)
-                                except UnicodeEncodeError:
-                                    print(text.encode("utf-8"), end="", flush=True)
-
-                            yield text
-
-                    elif "stream_end" == incoming_data["event"]:
-                        # Make sure any unprinted text is flushed.
+            return websocket
+
+    async def _request_by_token(self, prompt: str) -> typing.AsyncGenerator[str, None]:
+        websocket = await self._send_request(self._request_json(prompt))
+        async for msg in websocket:
+            # we expect a series of text messages in JSON encoding,
+            # like this:
+            #
+            # {"event": "text_stream", "message_num": 0, "text": ""}
+            # {"event": "text_stream", "message_num": 1, "text": "Oh"}
+            # {"event": "text_stream", "message_num": 2, "text": ","}
+            # {"event": "text_stream", "message_num": 3, "text": " okay"}
+            # {"event": "text_stream", "message_num": 4, "text": "."}
+            # {"event": "stream_end", "message_num": 5}
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                # bdata = typing.cast(bytes, msg.data)
+                # get_logger().debug(f"Received data: {bdata}")
+
+                incoming_data = msg.json()
+                event = incoming_data["event"]
+                if "text_stream" == event:
+                    self.total_response_tokens += 1
+                    text = incoming_data["text"]
+                    if text:
                         if self.log_all_the_things:
-                            print("", flush=True)
-                        yield SentenceSplitter.END_OF_INPUT
-                        return
-
-                    else:
-                        fancy_logger.get().warning(
-                            "Unexpected event: %s", incoming_data
-                        )
-
-                elif msg.type == aiohttp.WSMsgType.ERROR:
-                    fancy_logger.get().error(
-                        "WebSocket connection closed with error: %s", msg
-                    )
-                    raise http_client.OobaHttpClientError(
-                        f"WebSocket connection closed with error {msg}"
-                    )
-                elif msg.type == aiohttp.WSMsgType.CLOSED:
-                    fancy_logger.get().info(
-                        "WebSocket connection closed normally: %s", msg
-                    )
+                            # don't flush here, it would mean a syscall
+                            # per token.  We flush at the end of the stream.
+                            try:
+                                sys.stdout.write(text)
+                            except UnicodeEncodeError:
+                                sys.stdout.write(str(text.encode("utf-8")))
+
+                        yield text
+
+                elif "stream_end" == event:
+                    # Make sure any unprinted text is flushed.
+                    if self.log_all_the_things:
+                        print("", flush=True)
+                    yield SentenceSplitter.END_OF_INPUT
                     return
+
+                else:
+                    fancy_logger.get().warning("Unexpected event: %s", incoming_data)
+
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                fancy_logger.get().error(
+                    "WebSocket connection closed with error: %s", msg
+                )
+                raise http_client.OobaHttpClientError(
+                    f"WebSocket connection closed with error {msg}"
+                )
+            elif msg.type == aiohttp.WSMsgType.CLOSED:
+                fancy_logger.get().info("WebSocket connection closed normally: %s", msg)
+                return
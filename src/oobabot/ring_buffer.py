@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+A ring buffer, used to keep recent log lines and voice messages.
+"""
+import collections
+import typing
+
+T = typing.TypeVar("T")
+
+
+class RingBuffer(typing.Generic[T]):
+    """
+    A generic ring buffer, holding only the most recent
+    size_max elements.
+    """
+
+    def __init__(self, size_max: int):
+        self.data: typing.Deque[T] = collections.deque(maxlen=size_max)
+
+    def append(self, val: T) -> None:
+        """
+        Append an element at the end of the buffer, dropping
+        the oldest one if the buffer is full.
+        """
+        self.data.append(val)
+
+    def get(self) -> typing.List[T]:
+        """
+        Return a list of elements from the oldest to the newest.
+        """
+        return list(self.data)
+
+    def size(self) -> int:
+        """
+        Return the number of elements currently in the buffer.
+        """
+        return len(self.data)
@@ -6,6 +6,7 @@ API.  Takes a prompt and returns image binary data in PNG format.
 
 import asyncio
 import base64
+import json
 import re
 import time
 import typing
@@ -330,11 +331,18 @@ class StableDiffusionClient(http_client.SerializedHttpClient):
 
         return remaining_prompt.strip()
 
-    def generate_image(
+    @staticmethod
+    def _decode_image(body: bytes) -> bytes:
+        """
+        Pulls the first image out of a txt2img response body.
+        """
+        return base64.b64decode(json.loads(body)["images"][0])
+
+    async def generate_image(
         self,
         prompt: str,
         is_channel_nsfw: bool = False,
-    ) -> "asyncio.Task[bytes]":
+    ) -> bytes:
         """
         Generate an image from a prompt.
         Args:
@@ -374,8 +382,13 @@ class StableDiffusionClient(http_client.SerializedHttpClient):
                 if response.status != 200:
                     raise http_client.OobaHttpClientError(response)
                 duration = time.time() - start_time
-                json_body = await response.json()
-                image_bytes = base64.b64decode(json_body["images"][0])
+                body = await response.read()
+                # the response is a few MB of base64 inside JSON, so
+                # decode it in a worker thread rather than blocking
+                # the event loop (and every other chat) while we do.
+                image_bytes = await asyncio.get_running_loop().run_in_executor(
+                    None, self._decode_image, body
+                )
                 fancy_logger.get().debug(
                     "Stable Diffusion: Image generated, %d bytes in %.2f seconds",
                     len(image_bytes),
@@ -408,7 +421,7 @@ class StableDiffusionClient(http_client.SerializedHttpClient):
                     await asyncio.sleep(1)
                     tries += 1
 
-        return asyncio.create_task(do_post_with_retry())
+        return await do_post_with_retry()
 
     async def _setup(self):
         await self.set_options()
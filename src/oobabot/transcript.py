@@ -8,9 +8,9 @@ import random
 import re
 import typing
 
-from oobabot import discord_utils
 from oobabot import discrivener_message
 from oobabot import fancy_logger
+from oobabot import ring_buffer
 from oobabot import types
 
 
@@ -29,9 +29,7 @@ class Transcript:
         self._bot_user_id = bot_user_id
         self._wakewords: typing.Set[str] = set(word.lower() for word in wakewords)
 
-        self.message_buffer = discord_utils.RingBuffer[types.VoiceMessage](
-            self.NUM_LINES
-        )
+        self.message_buffer = ring_buffer.RingBuffer[types.VoiceMessage](self.NUM_LINES)
         self.silence_event = asyncio.Event()
         self.wakeword_event = asyncio.Event()
         self.last_mention = datetime.datetime.min
@@ -142,6 +142,8 @@ class DiscrivenerMessage(abc.ABC):
     Base class for all Discrivener messages.
     """
 
+    __slots__ = ("type",)
+
     @abc.abstractmethod
     def __init__(self, message: dict):
         ...
@@ -156,6 +158,8 @@ class VoiceMessage(DiscrivenerMessage):
     from a voice channel, attributed to a user.
     """
 
+    __slots__ = ("_user_id", "_start_time", "_audio_duration")
+
     def __init__(
         self,
         user_id: int,
@@ -207,6 +211,8 @@ class VoiceMessageWithTokens(VoiceMessage):
     A voice message that can be broken down into tokens.
     """
 
+    __slots__ = ()
+
     @property
     @abc.abstractmethod
     def tokens_with_confidence(self) -> typing.List[typing.Tuple[str, int]]:
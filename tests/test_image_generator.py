@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+Tests that the fast paths in ImageGenerator.maybe_get_image_prompt
+find the same prompts as searching with the IGNORECASE patterns,
+how StableDiffusionImageView handles its buttons, and how images
+are cached between requests
+"""
+import asyncio
+import random
+import types
+import typing
+
+import discord
+
+from oobabot import http_client
+from oobabot import image_generator
+from oobabot import settings
+from oobabot import templates
+
+
+def make_generator(image_words: typing.List[str]) -> image_generator.ImageGenerator:
+    # only the image words are needed to look for prompts
+    return image_generator.ImageGenerator(
+        None,  # type: ignore
+        {},
+        None,  # type: ignore
+        {"image_words": image_words},
+        None,  # type: ignore
+        None,  # type: ignore
+    )
+
+
+def expected_prompt(
+    generator: image_generator.ImageGenerator, content: str
+) -> typing.Optional[str]:
+    # the straightforward version: try each IGNORECASE pattern
+    # against the original message, in order
+    for image_pattern in generator.image_patterns:
+        match = image_pattern.search(content)
+        if match and len(match.group(2)) >= generator.MIN_IMAGE_PROMPT_LENGTH:
+            return match.group(2)
+    return None
+
+
+def check_messages(image_words: typing.List[str], messages: typing.List[str]):
+    generator = make_generator(image_words)
+    for content in messages:
+        raw_message = types.SimpleNamespace(content=content)
+        actual = generator.maybe_get_image_prompt(raw_message)  # type: ignore
+        assert expected_prompt(generator, content) == actual, content
+
+
+MESSAGES = [
+    "",
+    "pic",
+    "pic of",
+    "a pic",
+    "hello there",
+    "draw me a cat",
+    "DRAW ME a Cat In A Hat",
+    "Draw Me: a sunset",
+    "can you send a Picture of a dog?",
+    "PhOtO with a StRaNgE cAsE",
+    "nice photo",
+    "drawing with: crayons",
+    "Straße picture of a Fluß",
+    "ﬁne picture of ﬁsh",
+    "İstanbul photo of the city",
+    "a photo of İstanbul",
+    "picture of a cat\nand a dog",
+    "first line\ndraw me a horse\nlast line",
+    "draw me\na horse",
+    "pictures of cats",
+    "epic photo",
+]
+
+
+def test_default_image_words_match_ignorecase_patterns():
+    check_messages(settings.Settings.DEFAULT_IMAGE_WORDS, MESSAGES)
+
+
+def test_non_ascii_image_words_match_ignorecase_patterns():
+    check_messages(
+        ["straße", "ﬁx", "İmage", "Bild"],
+        MESSAGES
+        + [
+            "STRASSE of a house",
+            "straße of a house",
+            "FIX me a drawing of a bird",
+            "ﬁx me a drawing",
+            "i̇mage of a cat",
+            "İMAGE of a cat",
+            "ein Bild von einem Hund",
+            "BILD: ein Haus",
+        ],
+    )
+
+
+def test_regex_image_words_match_ignorecase_patterns():
+    # regex image words can't use the substring or case-folded paths.
+    # The word mustn't add a capture group, as the prompt is group 2.
+    check_messages([r"pic(?:ture)?s?", "draw me"], MESSAGES)
+
+
+def test_random_messages_match_ignorecase_patterns():
+    # with ASCII image words, so that the case-folded path is used
+    words = settings.Settings.DEFAULT_IMAGE_WORDS
+    parts = words + [
+        "straße",
+        "İmage",
+        "pıc",
+        "pİcture",
+        "ſketch",
+        "\u212aite",
+        "STRAẞE",
+        "a",
+        "cat",
+        "of",
+        "with",
+        ":",
+        "Photo",
+        "PICTURE",
+        "pics",
+        "\n",
+        "ß",
+        "SS",
+        "ﬁ",
+        "İ",
+        "x",
+        "DRAW",
+        "Me",
+    ]
+    rng = random.Random(1)
+    messages = [
+        " ".join(rng.choice(parts) for _ in range(rng.randint(0, 8)))
+        for _ in range(2000)
+    ]
+    check_messages(words, messages)
+
+
+class FakeImageMessage:
+    """
+    Records the buttons shown each time the view is sent to Discord.
+    """
+
+    def __init__(self):
+        self.sent_buttons: typing.List[typing.List[typing.Tuple[str, bool]]] = []
+
+    async def edit(self, **kwargs):
+        view = kwargs.get("view")
+        if view is not None:
+            self.sent_buttons.append(
+                [(button.label, button.disabled) for button in view.children]
+            )
+
+
+class FailingStableDiffusionClient:
+    """
+    Fails to generate an image, but only after the "Drawing.." label
+    has been shown.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def generate_image(self, _prompt: str, _is_channel_nsfw: bool) -> bytes:
+        await asyncio.sleep(self.delay)
+        raise http_client.OobaHttpClientError("generation failed")
+
+
+def make_interaction(user_id: int) -> typing.Any:
+    async def defer():
+        pass
+
+    return types.SimpleNamespace(
+        user=types.SimpleNamespace(id=user_id),
+        response=types.SimpleNamespace(defer=defer),
+    )
+
+
+def test_failed_regeneration_re_enables_buttons():
+    async def try_again_and_fail() -> FakeImageMessage:
+        template_store = templates.TemplateStore(
+            settings=settings.Settings().template_settings.get_all()
+        )
+        view = image_generator.StableDiffusionImageView(
+            FailingStableDiffusionClient(delay=0.05),  # type: ignore
+            is_channel_nsfw=False,
+            image_prompt="a cat",
+            requesting_user_id=1,
+            requesting_user_name="user",
+            template_store=template_store,
+        )
+        view.DRAWING_LABEL_DELAY_SECONDS = 0.01
+        image_message = FakeImageMessage()
+        view.image_message = image_message  # type: ignore
+        # the first button is "Try Again"
+        try_again_button = view.children[0]
+        await try_again_button.callback(make_interaction(1))  # type: ignore
+        return image_message
+
+    image_message = asyncio.run(try_again_and_fail())
+
+    labels = image_generator.StableDiffusionImageView
+    assert image_message.sent_buttons == [
+        [
+            (labels.LABEL_DRAWING, True),
+            (labels.LABEL_ACCEPT, True),
+            (labels.LABEL_DELETE, True),
+        ],
+        [
+            (labels.LABEL_TRY_AGAIN, False),
+            (labels.LABEL_ACCEPT, False),
+            (labels.LABEL_DELETE, False),
+        ],
+    ]
+
+
+class UnsendableImageMessage:
+    """
+    Fails every edit, as if Discord had rejected it.
+    """
+
+    async def edit(self, **_kwargs):
+        raise discord.DiscordException("edit failed")
+
+
+class SlowStableDiffusionClient:
+    """
+    Takes too long to generate an image, and records whether it
+    was cancelled.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def generate_image(self, _prompt: str, _is_channel_nsfw: bool) -> bytes:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return b"image"
+
+
+def test_failed_drawing_edit_cancels_regeneration():
+    stable_diffusion_client = SlowStableDiffusionClient()
+
+    async def try_again_and_fail_to_edit() -> bool:
+        template_store = templates.TemplateStore(
+            settings=settings.Settings().template_settings.get_all()
+        )
+        view = image_generator.StableDiffusionImageView(
+            stable_diffusion_client,  # type: ignore
+            is_channel_nsfw=False,
+            image_prompt="a cat",
+            requesting_user_id=1,
+            requesting_user_name="user",
+            template_store=template_store,
+        )
+        view.DRAWING_LABEL_DELAY_SECONDS = 0.01
+        view.image_message = UnsendableImageMessage()  # type: ignore
+        # the first button is "Try Again"
+        try_again_button = view.children[0]
+        await try_again_button.callback(make_interaction(1))  # type: ignore
+        # let the cancelled task finish unwinding.  Check before
+        # asyncio.run() returns, since it cancels any leftover tasks.
+        await asyncio.sleep(0)
+        return stable_diffusion_client.cancelled
+
+    assert asyncio.run(try_again_and_fail_to_edit())
+
+
+class CountingStableDiffusionClient:
+    """
+    Returns a new image each time it is asked for one.
+    """
+
+    def __init__(self):
+        self.images_generated = 0
+
+    # ImageGenerator passes is_channel_nsfw by keyword, so it keeps its name
+    async def generate_image(
+        self, prompt: str, is_channel_nsfw: bool  # pylint: disable=unused-argument
+    ) -> bytes:
+        self.images_generated += 1
+        return f"{prompt} #{self.images_generated}".encode()
+
+
+class FakeChannel:
+    """
+    Records the views sent along with each image.
+    """
+
+    def __init__(self):
+        self.views: typing.List[typing.Any] = []
+
+    async def send(self, *_args, **kwargs):
+        self.views.append(kwargs.get("view"))
+        return FakeImageMessage()
+
+
+def test_rejecting_a_shared_image_keeps_a_newer_one_cached():
+    async def request_images() -> image_generator.ImageGenerator:
+        sd_client = CountingStableDiffusionClient()
+        generator = image_generator.ImageGenerator(
+            None,  # type: ignore
+            {},
+            None,  # type: ignore
+            {"image_words": []},
+            sd_client,  # type: ignore
+            templates.TemplateStore(
+                settings=settings.Settings().template_settings.get_all()
+            ),
+        )
+        channel = FakeChannel()
+
+        async def request_image(user_id: int):
+            raw_message = types.SimpleNamespace(
+                channel=channel,
+                author=types.SimpleNamespace(id=user_id, display_name="user"),
+            )
+            await generator._generate_image(  # pylint: disable=protected-access
+                "a cat", raw_message, channel  # type: ignore
+            )
+            return channel.views[-1]
+
+        # the second view is shown the first view's cached image
+        first_view = await request_image(1)
+        second_view = await request_image(2)
+        assert sd_client.images_generated == 1
+
+        # rejecting the shared image evicts it, so the next
+        # request draws a new one
+        first_view.on_image_rejected()
+        await request_image(3)
+        assert sd_client.images_generated == 2
+
+        # the second view was shown the old image, so it
+        # mustn't evict the new one
+        second_view.on_image_rejected()
+        await request_image(4)
+        assert sd_client.images_generated == 2
+        return generator
+
+    generator = asyncio.run(request_images())
+    assert list(generator.image_cache.values()) == [b"a cat #2"]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the request JSON the Ooba client sends, and how it
+reuses its websocket between requests
+"""
+import asyncio
+import json
+import typing
+
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+import pytest
+
+from oobabot import ooba_client
+
+
+def make_client(request_params: typing.Dict[str, typing.Any]) -> ooba_client.OobaClient:
+    return ooba_client.OobaClient(
+        {
+            "base_url": "http://localhost:5000",
+            "message_regex": "",
+            "request_params": request_params,
+            "log_all_the_things": False,
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "request_params",
+    [
+        {},
+        {"max_new_tokens": 250, "do_sample": True, "temperature": 1.3},
+        {"stopping_strings": ["\n### ", '"quoted"'], "seed": -1, "extra": None},
+        {"prompt": "from the params"},
+    ],
+)
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "",
+        "Hello, world!",
+        'quotes " and \\ backslashes\nand newlines',
+        "non-ASCII: café, 日本語, emoji 😀",
+    ],
+)
+def test_request_json_matches_request_dict(
+    request_params: typing.Dict[str, typing.Any], prompt: str
+):
+    client = make_client(request_params)
+    # a "prompt" key in the params overrides the prompt, same as
+    # if they had been merged into one dict
+    request_json = client._request_json(prompt)  # pylint: disable=protected-access
+    assert json.loads(request_json) == {
+        "prompt": prompt,
+        **request_params,
+    }
+
+
+class FakeStreamingServer:
+    """
+    Serves the streaming API on a local port.  Records each prompt it
+    receives, and can close the connection after answering, or
+    instead of answering.
+    """
+
+    def __init__(self, close_after_reply: bool, reply: bool = True):
+        self.close_after_reply = close_after_reply
+        self.reply = reply
+        self.prompts: typing.List[str] = []
+        app = aiohttp.web.Application()
+        app.router.add_get(
+            ooba_client.OobaClient.OOBABOOGA_STREAMING_URI_PATH, self.handle
+        )
+        self.server = aiohttp.test_utils.TestServer(app)
+
+    async def handle(self, request: aiohttp.web.Request):
+        websocket = aiohttp.web.WebSocketResponse()
+        await websocket.prepare(request)
+        async for msg in websocket:
+            self.prompts.append(json.loads(msg.data)["prompt"])
+            if self.reply:
+                await websocket.send_json(
+                    {"event": "text_stream", "message_num": 0, "text": "Oh, okay."}
+                )
+                await websocket.send_json({"event": "stream_end", "message_num": 1})
+            if self.close_after_reply or not self.reply:
+                await websocket.close()
+        return websocket
+
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+
+async def request_twice(server: FakeStreamingServer) -> typing.List[str]:
+    await server.server.start_server()
+    try:
+        client = make_client({})
+        client.base_url = server.base_url()
+        async with client:
+            await client.setup()
+            responses = []
+            for prompt in ("first", "second"):
+                responses.append(await client.request_as_string(prompt))
+                # give the server time to close the idle connection
+                await asyncio.sleep(0.05)
+            return responses
+    finally:
+        await server.server.close()
+
+
+def test_reconnects_after_server_closes_idle_websocket():
+    server = FakeStreamingServer(close_after_reply=True)
+    responses = asyncio.run(request_twice(server))
+    assert responses == ["Oh, okay.", "Oh, okay."]
+    assert server.prompts == ["first", "second"]
+
+
+def test_reuses_open_websocket():
+    server = FakeStreamingServer(close_after_reply=False)
+    responses = asyncio.run(request_twice(server))
+    assert responses == ["Oh, okay.", "Oh, okay."]
+    assert server.prompts == ["first", "second"]
+
+
+def test_does_not_resend_a_request_the_server_received():
+    server = FakeStreamingServer(close_after_reply=False, reply=False)
+    responses = asyncio.run(request_twice(server))
+    # the connection closes without a reply.  Each prompt was
+    # delivered, so neither is sent again.
+    assert responses == ["", ""]
+    assert server.prompts == ["first", "second"]
@@ -32,6 +32,27 @@ def load_messages() -> typing.List["types.DiscrivenerMessage"]:
     return messages
 
 
+def test_to_message_matches_object_pairs_hook():
+    with open(TEST_FILE, "rb") as file:
+        lines = file.readlines()
+    for line in lines:
+        expected = json.loads(
+            line,
+            object_pairs_hook=discrivener_message.object_pairs_hook,
+        )
+        for actual in (
+            discrivener_message.to_message(json.loads(line)),
+            discrivener_message.from_json_line(line),
+        ):
+            assert type(expected) is type(actual)
+            if isinstance(expected, discrivener_message.UserVoiceMessage):
+                assert isinstance(actual, discrivener_message.UserVoiceMessage)
+                assert expected.text == actual.text
+                assert expected.tokens_with_confidence == actual.tokens_with_confidence
+            else:
+                assert str(expected) == str(actual)
+
+
 def test_can_make_transcript():
     messages = load_messages()
 